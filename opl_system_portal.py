@@ -9,6 +9,32 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Regex pattern of a valid postal code (i.e. six alternating letters and digits such as "K1A1A1")
+_POSTAL_RE = re.compile(r'^[A-Za-z][0-9][A-Za-z][0-9][A-Za-z][0-9]$')
+
+# Data types of each column in the Ontario Public Library Excel data sets, used to skip type inference when importing them
+_DTYPES = {'Library Full Name': str,
+           'Library Number': str,
+           'Year': 'int64',
+           'Ontario Library Service Region': str,
+           'Service Type': str,
+           'Mailing Address': str,
+           'Street Address': str,
+           'City/Town': str,
+           'Province': str,
+           'Postal Code': str,
+           'Web Site Address': str,
+           'No. Cardholders': 'int64',
+           'English Print Titles Held': 'int64',
+           'French Print Titles Held': 'int64',
+           'Other Print Titles Held': 'int64',
+           'Total Print Titles Held': 'int64',
+           'English E-book and E-audio Titles': 'int64',
+           'French E-book and E-audio Titles': 'int64',
+           'Other E-book and E-audio Titles': 'int64',
+           'Total E-book and E-audio Titles': 'int64'}
 
 
 class LibraryPortal:
@@ -16,6 +42,13 @@ class LibraryPortal:
 
         Attributes:
             data (DataFrame): DataFrame that stores detailed information about each library branch
+            year_sums (DataFrame): DataFrame that stores the sum of each numeric column grouped by year
+            by_year (dict): Dictionary that maps each year to a DataFrame of the library branch data from that year
+            names_set (set): Set of all library branch names in the data
+            codes_set (set): Set of all library branch codes in the data
+            postal_index (dict): Dictionary that maps the first three characters of a postal code to the positions of the 2019 library branches with it
+            service_pivot (DataFrame): Pivot table of the average 'Resources per Cardholder' by 'Service Type' and 'Service Region'
+            describe_by_year (dict): Dictionary that maps each year to the described data statistics and column sums from that year
 
         Methods:
             main_menu(): Prompt user to select an option in the library portal
@@ -27,8 +60,31 @@ class LibraryPortal:
             access_archive(): Access yearly data and statistical information of the library system
             generate_plots(year): Generate two plots and output it to the user 
     """
+    # Declare the attributes as slots to avoid a per-instance dictionary (private names are mangled here as well)
+    __slots__ = ('__data', '__year_sums', '__by_year', '__postal_index', '__names_set', '__codes_set', '__describe_by_year', '__service_pivot')
+
     def __init__(self, data):
         self.__data = data
+        self.__year_sums = data.groupby(level='Year').sum(numeric_only=True)  # Aggregate the yearly sums once to reuse them in the archives
+        self.__by_year = {year: data.xs(year, level='Year') for year in data.index.get_level_values('Year').unique()}  # Split the data by year once
+
+        # Index the positions of the 2019 library branches by the first three characters of their postal codes for the locator
+        postal_prefixes = self.__by_year[2019]['Postal Code'].astype(str).str[:3]
+        self.__postal_index = postal_prefixes.groupby(postal_prefixes).indices
+
+        # Store the library names and codes in sets for fast lookups of user input
+        self.__names_set = set(data.index.get_level_values('Library Full Name'))
+        self.__codes_set = set(data.index.get_level_values('Library Number'))
+
+        # Compute the statistics shown in the yearly archives once, since they do not change between calls
+        self.__describe_by_year = {}
+        for year, year_data in self.__by_year.items():
+            described_data = year_data.describe()
+            described_data.loc['sum'] = year_data.select_dtypes('number').to_numpy().sum(axis=0)  # Add a row that aggregates the sum of all columns
+            self.__describe_by_year[year] = described_data
+
+        self.__service_pivot = data.pivot_table('Resources per Cardholder', index='Service Type', columns='Ontario Library Service Region')
+        self.__service_pivot = self.__service_pivot.replace(0, "0.0*").replace(np.nan, "N/A**")  # Add annotations to null and NaN values for the side notes
     
     def main_menu(self):
         """Main menu that display a list of options on the library portal and prompts the user to select one
@@ -124,14 +180,14 @@ class LibraryPortal:
             library_id = input('Please enter a library branch name or code (e.g. "Toronto" or "L0353"): ').title()
 
             try:
-                # If input is valid, use an index slice on the DataFrame to obtain the information of the selected library branch
-                if library_id in self.__data.index.get_level_values('Library Full Name'):
+                # If input is valid, use a cross-section of the DataFrame to obtain the information of the selected library branch
+                if library_id in self.__names_set:
                     # Continue if "Library Full Name" input is valid
-                    branch_data = self.__data.loc[pd.IndexSlice[library_id, :, :], pd.IndexSlice[:]]
+                    branch_data = self.__data.xs(library_id, level='Library Full Name', drop_level=False)
                     break
-                elif library_id in self.__data.index.get_level_values('Library Number'):
+                elif library_id in self.__codes_set:
                     # Continue if "Library Number" input is valid
-                    branch_data = self.__data.loc[pd.IndexSlice[:, library_id, :], pd.IndexSlice[:]]
+                    branch_data = self.__data.xs(library_id, level='Library Number', drop_level=False)
                     break
                 else:
                     raise ValueError
@@ -151,11 +207,13 @@ class LibraryPortal:
             Returns:
                 None 
         """
-        branch_series = branch_df.iloc[-1]  # Slice the data of the most recent year (2019) from the DataFrame
+        # Slice the data of the most recent year (2019) from the DataFrame
+        latest_year = branch_df.index.get_level_values('Year').max()
+        branch_series = branch_df.xs(latest_year, level='Year', drop_level=False).iloc[0]
 
         # Create a dictionary to map the keys to their correct value counterparts in the DataFrame columns using the proper indices
-        branch_dict = {"Library Name": branch_df.index[-1][0],
-                        "Library Number": branch_df.index[-1][1],
+        branch_dict = {"Library Name": branch_series.name[0],
+                        "Library Number": branch_series.name[1],
                         "Service Region": branch_series['Ontario Library Service Region'],
                         "Street Address": None,  # Initialized as 'None' to properly format the address below
                         "Website or E-mail": branch_series['Web Site Address'],
@@ -197,7 +255,7 @@ class LibraryPortal:
 
             try:
                 # Check if postal code is valid (i.e. contains six alternating alphanumeric characters) using regex
-                if len(postal_code) == 6 and re.compile(r'([a-zA-Z][0-9]){3}').match(postal_code):
+                if _POSTAL_RE.match(postal_code):
                     postal_code = postal_code.upper()  # Convert letters to uppercase if any are lowercase
                     break
                 else:
@@ -206,8 +264,9 @@ class LibraryPortal:
                 # Raise ValueError if input is invalid
                 print("Please enter a valid postal code.")
 
-        # Use a boolean mask to filter the postal codes of the library branches that match the first three characters of the user's postal code
-        data_by_postal_code = self.__data.loc[pd.IndexSlice[:, :, 2019], pd.IndexSlice[:]][self.__data.loc[pd.IndexSlice[:, :, 2019], pd.IndexSlice['Postal Code']].str.match(r'^' + postal_code[:3])]
+        # Look up the library branches with postal codes that match the first three characters of the user's postal code
+        positions = self.__postal_index.get(postal_code[:3])
+        data_by_postal_code = self.__by_year[2019].iloc[positions] if positions is not None else self.__by_year[2019].iloc[:0]
 
         if len(data_by_postal_code.index) == 0:
             # If filtered DataFrame is empty, print message to user that no libraries were found 
@@ -229,16 +288,17 @@ class LibraryPortal:
 
                     # Depending on the user's needs, sort the filtered DataFrame accordingly
                     if user_selection == 1:
-                        # If user wants to borrow library resources, sort by highest "Resources per Cardholder"
-                        data_by_postal_code = data_by_postal_code.sort_values('Resources per Cardholder', ascending=False)
+                        # If user wants to borrow library resources, select the five highest "Resources per Cardholder"
+                        data_by_postal_code = data_by_postal_code.nlargest(5, 'Resources per Cardholder')
                         break
                     elif user_selection == 2:
-                        # If user wants a study or work space, sort by lowest "No. Cardholders"
-                        data_by_postal_code = data_by_postal_code.sort_values('No. Cardholders')
+                        # If user wants a study or work space, select the five lowest "No. Cardholders"
+                        data_by_postal_code = data_by_postal_code.nsmallest(5, 'No. Cardholders')
                         break
                     elif user_selection == 3:
-                        # If user has no preference, randomize the filtered DataFrame
-                        data_by_postal_code = data_by_postal_code.sample(frac=1)
+                        # If user has no preference, pick up to five random library branches from the filtered DataFrame
+                        random_idx = np.random.choice(len(data_by_postal_code), size=min(5, len(data_by_postal_code)), replace=False)
+                        data_by_postal_code = data_by_postal_code.iloc[random_idx]
                         break
                     else:
                         raise ValueError
@@ -259,12 +319,10 @@ class LibraryPortal:
         """
         # Print the first five library branches nearby and available to the user
         print("\nHere is a list of libraries we found for you:")
+        top5_names = sorted_locations.index.get_level_values('Library Full Name')[:5]
 
-        for i, row_index in enumerate(sorted_locations.iterrows(), start=1):
-            print(str(i) + ". " + row_index[0][0])
-        
-            if i == 5:
-                break
+        for i, name in enumerate(top5_names, start=1):
+            print(str(i) + ". " + name)
         
         # Prompt user to select a library branch from the list
         while True:
@@ -273,7 +331,7 @@ class LibraryPortal:
 
                 if branch_selection in range(1, 6):
                     # If valid number, obtain the library name
-                    branch_name = sorted_locations.index.get_level_values('Library Full Name')[branch_selection - 1]
+                    branch_name = top5_names[branch_selection - 1]
                     break
                 else:
                     raise ValueError
@@ -282,7 +340,7 @@ class LibraryPortal:
                 print("Invalid input. Please enter a number between 1 and 5.")
 
         # Use the library name to slice its data from the original DataFrame
-        self.print_branch_info(self.__data.loc[pd.IndexSlice[branch_name, :, :], pd.IndexSlice[:]])
+        self.print_branch_info(self.__data.xs(branch_name, level='Library Full Name', drop_level=False))
         self.next_user_action(2.2, sorted_locations)  # Prompt user to select next action
 
     def access_archives(self):
@@ -312,22 +370,13 @@ class LibraryPortal:
 
         print("\n*******LIBRARY STATISTICAL ARCHIVES IN " + str(year) + "*******")
 
-        # Create a row that aggregates the sum of all columns in the DataFrame
-        sum_row = self.__data.groupby('Year').sum().loc[year, :]
-        sum_row.rename('sum', inplace=True)
-        sum_df = pd.DataFrame(sum_row)
-       
-        # Concatenate the summed row to a set of described data statistics and print the DataFrame
+        # Print the set of described data statistics with the summed row of the selected year
         print("\n*****GENERAL DATA STATISTICS*****\n")
-        described_data = pd.concat([self.__data.loc[pd.IndexSlice[:, :, year], pd.IndexSlice[:]].describe(), sum_df.T])
-        print(described_data)
+        print(self.__describe_by_year[year])
 
         # Create and print a pivot table containing the average 'Resources per Cardholder' by 'Service Region' and 'Service Type'
         print("\n*****AVERAGE RESOURCES PER CARDHOLDER BY SERVICE REGION & TYPE*****\n")
-        service_type_pivot = self.__data.pivot_table('Resources per Cardholder', index='Service Type', columns='Ontario Library Service Region')
-        service_type_pivot.replace(0, "0.0*", inplace=True)  # Add annotations to null values for the side notes below
-        service_type_pivot.replace(np.nan, "N/A**", inplace=True)  # Add annotations to NaN values for the side notes below
-        print(service_type_pivot)
+        print(self.__service_pivot)
         
         # Display side notes pertaining to the null or NaN values in the above pivot table
         print("\nNotes:")
@@ -336,9 +385,11 @@ class LibraryPortal:
 
         print("\n*****LIBRARY RECORDS*****\n")
         # Print the libraries with the max values in each column, serving as the library record-holders
-        for col in self.__data.columns[8:]:
-            max_value = self.__data.loc[pd.IndexSlice[:, :, year], pd.IndexSlice[col]].max()
-            branch_name = self.__data[self.__data[col] == max_value].index[0][0]
+        numeric_data = self.__by_year[year].iloc[:, 8:]
+
+        for col, record_idx in numeric_data.idxmax().items():
+            max_value = numeric_data.at[record_idx, col]  # Look up the value per column to keep its original dtype
+            branch_name = record_idx[0]  # Index label is a (name, number) tuple
             print("Most " + col + ": " + branch_name + " (" + str(max_value) + ")")
 
         # Generate and display the Matplotlib plots
@@ -356,9 +407,9 @@ class LibraryPortal:
             Returns:
                 None
         """
-        # Slice the sum of the total number of print titles and e-resources data from the DataFrame
-        print_titles_data = self.__data.groupby('Year').sum().loc[pd.IndexSlice[:], pd.IndexSlice['English Print Titles Held':'Other Print Titles Held']]
-        eresources_data = self.__data.groupby('Year').sum().loc[pd.IndexSlice[:], pd.IndexSlice['English E-book and E-audio Titles':'Other E-book and E-audio Titles']]
+        # Slice the sum of the total number of print titles and e-resources data from the cached yearly sums
+        print_titles_data = self.__year_sums.loc[:, 'English Print Titles Held':'Other Print Titles Held']
+        eresources_data = self.__year_sums.loc[:, 'English E-book and E-audio Titles':'Other E-book and E-audio Titles']
 
         # Create and format a plot showing the total number of resources by language and type in the specified year
         plt.figure(1)
@@ -397,21 +448,28 @@ def import_data():
         Returns:
             DataFrame that stores detailed information about each library branch
     """
-    # Import the Ontario Public Library System Excel data sets from 2017 to 2019 
-    library_data_2017 = pd.read_excel(r".\Ontario Public Library Datasets\ontario_public_library_statistics_2017.xlsx")
-    library_data_2018 = pd.read_excel(r".\Ontario Public Library Datasets\ontario_public_library_statistics_2018.xlsx")
-    library_data_2019 = pd.read_excel(r".\Ontario Public Library Datasets\ontario_public_library_statistics_2019.xlsx")
+    # Import the Ontario Public Library System Excel data sets from 2017 to 2019 in parallel
+    paths = [r".\Ontario Public Library Datasets\ontario_public_library_statistics_2017.xlsx",
+             r".\Ontario Public Library Datasets\ontario_public_library_statistics_2018.xlsx",
+             r".\Ontario Public Library Datasets\ontario_public_library_statistics_2019.xlsx"]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        library_data_2017, library_data_2018, library_data_2019 = executor.map(lambda path: pd.read_excel(path, engine='openpyxl', dtype=_DTYPES), paths)
 
-    # Merge all the data sets together on all of their columns
-    library_data_merge = pd.merge(library_data_2017, library_data_2018, on=list(library_data_2019.columns), how='outer')
-    library_data_master = pd.merge(library_data_merge, library_data_2019, on=list(library_data_2019.columns), how='outer')
+    # Combine all the data sets together and remove any rows that are duplicated across them
+    library_data_master = pd.concat([library_data_2017, library_data_2018, library_data_2019], ignore_index=True).drop_duplicates()
 
-    # Forward fill the missing 'Street Address' columns with valid 'Mailing Address' columns
-    library_data_master[['Mailing Address', 'Street Address']] = library_data_master[['Mailing Address', 'Street Address']].fillna(method='ffill', axis=1)
+    # Fill the missing 'Street Address' columns with valid 'Mailing Address' columns
+    street_address = library_data_master['Street Address']
+    library_data_master['Street Address'] = street_address.where(street_address.notna(), library_data_master['Mailing Address'])
 
     # Sort the indices to obtain an organized DataFrame with hierarchical indices
     library_data_master = library_data_master.set_index(['Library Full Name', 'Library Number', 'Year']).sort_index()
 
+    # Convert the repetitive string columns to categories to reduce memory usage and speed up grouping
+    for col in ['Ontario Library Service Region', 'Service Type', 'City/Town', 'Postal Code', 'Web Site Address']:
+        library_data_master[col] = library_data_master[col].astype('category')
+
     return library_data_master
 
 
@@ -426,11 +484,12 @@ def add_columns(library_data):
 
     """
     # Create two columns of the total print titles held and resource available per cardholder, and add it to the DataFrame
-    library_data['Total Resources'] = library_data['Total Print Titles Held'] + library_data['Total E-book and E-audio Titles']
-    library_data['Resources per Cardholder'] = library_data['Total Resources'] / library_data['No. Cardholders']
-    
-    # Replace all the NaN values with 0 as a result of dividing by zero from missing data 
-    library_data['Resources per Cardholder'].replace(np.nan, 0, inplace=True)
+    total_resources = library_data['Total Print Titles Held'].to_numpy() + library_data['Total E-book and E-audio Titles'].to_numpy()
+    no_cardholders = library_data['No. Cardholders'].to_numpy(dtype=float)
+    library_data['Total Resources'] = total_resources
+
+    # Only divide where there are cardholders, leaving 0 in place of dividing by zero from missing data
+    library_data['Resources per Cardholder'] = np.divide(total_resources, no_cardholders, out=np.zeros(len(no_cardholders)), where=no_cardholders > 0)
 
     return library_data
 